@@ -4,163 +4,472 @@
 
 import sys
 import json
+import heapq
 import queue
+import select
+import selectors
 import socket
+import struct
 import threading
 import time
 import uuid
 import random
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
 from dataclasses import dataclass
-from typing import Dict, Optional
+from typing import Deque, Dict, Optional, Set
 import tkinter as tk
 from tkinter import ttk, scrolledtext
 
+try:
+    # Opcional: orjson serializa direto para bytes e é bem mais rápido
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj):
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    _loads = json.loads
+
 HOST = "127.0.0.1"
 
-def json_line(sock):
-    data = b""
-    while True:
-        ch = sock.recv(1)
-        if not ch:
-            break
-        data += ch
-        if ch == b'\n':
-            break
-    if not data:
+# Quadro: 4 bytes big-endian com o tamanho + corpo JSON em UTF-8
+FRAME_HEADER = struct.Struct(">I")
+MAX_FRAME = 1 << 20
+
+def _recv_exactly(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:])
+        if not k:
+            return None
+        got += k
+    return buf
+
+def recv_framed(sock):
+    head = _recv_exactly(sock, FRAME_HEADER.size)
+    if head is None:
+        return None
+    (size,) = FRAME_HEADER.unpack(head)
+    if size > MAX_FRAME:
+        return None
+    body = _recv_exactly(sock, size)
+    if body is None:
         return None
     try:
-        return json.loads(data.decode("utf-8").strip())
+        return _loads(body)
     except Exception:
         return None
 
-def send_json_line(sock, obj):
-    line = (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
-    sock.sendall(line)
+def set_nodelay(sock):
+    # Mensagens de controle são minúsculas: sem Nagle, sem espera por coalescência
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
 
-@dataclass
+def encode_frame(obj):
+    body = _dumps(obj)
+    return FRAME_HEADER.pack(len(body)) + body
+
+def send_framed(sock, obj):
+    sock.sendall(encode_frame(obj))
+
+@dataclass(slots=True)
 class MessageStatus:
     id: str
     text: str
     ts: float
-    attempts: int = 0
+    # Campos lidos a cada tick do watcher primeiro
+    state: str = "new"  # new | queued | sending | ack1 | delivered | failed
     ack1: bool = False
+    attempts: int = 0
     ack2: bool = False
     last_error: Optional[str] = None
     next_retry_ms: Optional[int] = None
-    state: str = "new"  # new | queued | sending | ack1 | delivered | failed
+
+class _Conn:
+    """Estado de uma conexão aceita pelo reator do ServerThread."""
+
+    READING_LEN, READING_BODY = 0, 1
+    BUF_SIZE = 4096
+
+    __slots__ = ("sock", "buf", "n", "state", "need", "out", "events", "closed")
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buf = bytearray(_Conn.BUF_SIZE)  # recebido e ainda não consumido: buf[:n]
+        self.n = 0
+        self.state = _Conn.READING_LEN
+        self.need = FRAME_HEADER.size
+        self.out = bytearray()  # resposta pendente de escrita
+        self.events = selectors.EVENT_READ
+        self.closed = False
 
 class ServerThread(threading.Thread):
-    def __init__(self, name, port, inbox_queue, ui_flags):
+    def __init__(self, name, port, inbox_queue, flags):
         super().__init__(daemon=True)
         self.name = name
         self.port = port
         self.inbox_queue = inbox_queue
-        self.ui_flags = ui_flags  # Tk vars
-        self.socket = None
+        # Cópia em dicionário simples publicada pela thread da UI (NodeApp._publish_flags);
+        # o reator nunca toca nas variáveis Tk.
+        self.flag_snapshot = dict(flags)
         self.stop_event = threading.Event()
+        self._sel = None
+        self._conns = set()
+        self._timers = []  # heap de (prazo, seq, fn, args)
+        self._timer_seq = 0
+        # stop() escreve em _wake_w para acordar o select() imediatamente
+        # (socketpair em vez de os.pipe: selectors no Windows só aceita sockets)
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        # connect() bloqueante do DELIVERED fica fora da thread do reator
+        self._tx_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="delivered")
 
     def _safe_flag(self, key, default=False):
-        try:
-            return bool(self.ui_flags[key].get())
-        except Exception:
-            return default
+        return bool(self.flag_snapshot.get(key, default))
 
+    # ------------- Reator -------------
     def run(self):
         while not self.stop_event.is_set():
             try:
-                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+                with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s, \
+                        selectors.DefaultSelector() as sel:
                     s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
                     s.bind((HOST, self.port))
                     s.listen(5)
-                    self.socket = s
-                    while not self.stop_event.is_set():
-                        try:
-                            s.settimeout(0.5)
-                            conn, addr = s.accept()
-                        except socket.timeout:
-                            continue
-                        threading.Thread(target=self.handle_conn, args=(conn, addr), daemon=True).start()
+                    s.setblocking(False)
+                    self._sel = sel
+                    sel.register(s, selectors.EVENT_READ)
+                    sel.register(self._wake_r, selectors.EVENT_READ)
+                    try:
+                        while not self.stop_event.is_set():
+                            for key, events in sel.select(self._next_timeout()):
+                                if key.fileobj is s:
+                                    self._accept(s)
+                                    continue
+                                if key.fileobj is self._wake_r:
+                                    self._drain_wakeups()
+                                    continue
+                                self._guard(key.data, self._on_events, events)
+                            self._run_timers()
+                    finally:
+                        for c in list(self._conns):
+                            self._close(c)
+                        self._timers.clear()
             except OSError:
-                time.sleep(1.0)
-
-    def handle_conn(self, conn, addr):
-        with conn:
-            # Não rejeita a conexão antes de ler o tipo;
-            # assim podemos responder PING mesmo em alguns modos.
-            conn.settimeout(2.0)
-            msg = json_line(conn)
-            if not msg:
-                return
+                self.stop_event.wait(1.0)
+        self._tx_pool.shutdown(wait=False, cancel_futures=True)
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def call_later(self, delay, fn, *args):
+        """Agenda fn(*args) no reator (chamar apenas da própria thread do servidor)."""
+        self._timer_seq += 1
+        heapq.heappush(self._timers, (time.monotonic() + delay, self._timer_seq, fn, args))
+
+    def _next_timeout(self):
+        # Sem timers pendentes, dorme até haver I/O ou um stop()
+        if not self._timers:
+            return None
+        return max(0.0, self._timers[0][0] - time.monotonic())
+
+    def _drain_wakeups(self):
+        try:
+            while self._wake_r.recv(64):
+                pass
+        except OSError:
+            pass
 
-            mtype = msg.get("type")
+    def _run_timers(self):
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, _, fn, args = heapq.heappop(self._timers)
+            try:
+                fn(*args)
+            except Exception:
+                pass
 
-            # PING → PONG (somente se não estiver em rejeição dura)
-            if mtype == "PING":
-                if not self._safe_flag("reject_conn", False):
-                    try:
-                        send_json_line(conn, {"type": "PONG"})
-                    except Exception:
-                        pass
-                return
+    def _guard(self, c, fn, *args):
+        # Erro inesperado derruba só esta conexão, nunca o reator
+        try:
+            fn(c, *args)
+        except Exception:
+            self._close(c)
+
+    def _on_events(self, c, events):
+        if events & selectors.EVENT_READ:
+            self._on_readable(c)
+        if events & selectors.EVENT_WRITE and not c.closed:
+            self._flush(c)
+
+    def _accept(self, s):
+        try:
+            conn, _ = s.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        set_nodelay(conn)
+        c = _Conn(conn)
+        self._conns.add(c)
+        self._sel.register(conn, selectors.EVENT_READ, c)
+
+    def _close(self, c):
+        if c.closed:
+            return
+        c.closed = True
+        self._conns.discard(c)
+        try:
+            self._sel.unregister(c.sock)
+        except (KeyError, ValueError):
+            pass
+        c.sock.close()
 
-            # Para outras mensagens, respeita flags de simulação
+    def _on_readable(self, c):
+        if c.n == len(c.buf):
+            c.buf.extend(bytes(len(c.buf)))
+        try:
+            n = c.sock.recv_into(memoryview(c.buf)[c.n:])
+        except BlockingIOError:
+            return
+        except OSError:
+            n = 0
+        if not n:
+            self._close(c)
+            return
+        c.n += n
+
+        # Consome todos os quadros completos já recebidos
+        start = 0
+        while not c.closed and c.n - start >= c.need:
+            if c.state == _Conn.READING_LEN:
+                (size,) = FRAME_HEADER.unpack_from(c.buf, start)
+                start += FRAME_HEADER.size
+                if size > MAX_FRAME:
+                    self._close(c)
+                    break
+                c.state, c.need = _Conn.READING_BODY, size
+                continue
+            body = c.buf[start:start + c.need]
+            start += c.need
+            c.state, c.need = _Conn.READING_LEN, FRAME_HEADER.size
+            try:
+                msg = _loads(body)
+            except Exception:  # inclui RecursionError do json da stdlib
+                msg = None
+            if not isinstance(msg, dict) or not msg or not self._handle_msg(c, msg):
+                self._close(c)
+        if start and not c.closed:
+            rest = c.n - start
+            if len(c.buf) > _Conn.BUF_SIZE and c.need <= _Conn.BUF_SIZE:
+                # Quadro grande já consumido: volta ao buffer padrão
+                buf = bytearray(_Conn.BUF_SIZE)
+                buf[:rest] = c.buf[start:c.n]
+                c.buf = buf
+            else:
+                c.buf[:rest] = c.buf[start:c.n]
+            c.n = rest
+
+    def _reply(self, c, obj):
+        if c.closed:
+            return
+        c.out += encode_frame(obj)
+        self._flush(c)
+
+    def _flush(self, c):
+        try:
+            sent = c.sock.send(c.out)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(c)
+            return
+        del c.out[:sent]
+        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if c.out else 0)
+        if events != c.events:
+            c.events = events
+            self._sel.modify(c.sock, events, c)
+
+    # ------------- Protocolo -------------
+    def _handle_msg(self, c, msg) -> bool:
+        """Trata uma mensagem; False encerra a conexão."""
+        # Não rejeita a conexão antes de ler o tipo;
+        # assim podemos responder PING mesmo em alguns modos.
+        mtype = msg.get("type")
+
+        # PING → PONG (somente se não estiver em rejeição dura)
+        if mtype == "PING":
             if self._safe_flag("reject_conn", False):
-                return
+                return False
+            self._reply(c, {"type": "PONG", "id": msg.get("id")})
+            return True
+
+        # Para outras mensagens, respeita flags de simulação
+        if self._safe_flag("reject_conn", False):
+            return False
 
+        try:
+            proc_delay = int(self.flag_snapshot.get("proc_delay_ms", 0))
+        except Exception:
+            proc_delay = 0
+        if proc_delay > 0:
+            # Atraso simulado sem bloquear o reator
+            self.call_later(proc_delay / 1000.0, self._guard, c, self._process, msg)
+        else:
+            self._process(c, msg)
+        return True
+
+    def _process(self, c, msg):
+        mtype = msg.get("type")
+        if mtype == "MSG":
+            mid = msg.get("id")
+            text = msg.get("text", "")
+            sender = msg.get("sender", "?")
             try:
-                proc_delay = int(self.ui_flags["proc_delay_ms"].get())
+                reply_to = int(msg.get("reply_to_port", 0)) or None
             except Exception:
-                proc_delay = 0
-            if proc_delay > 0:
-                time.sleep(proc_delay / 1000.0)
-
-            if mtype == "MSG":
-                mid = msg.get("id")
-                text = msg.get("text", "")
-                sender = msg.get("sender", "?")
-                try:
-                    reply_to = int(msg.get("reply_to_port", 0)) or None
-                except Exception:
-                    reply_to = None
+                reply_to = None
+
+            self.inbox_queue.put(("RECV", {"id": mid, "from": sender, "text": text}))
 
-                self.inbox_queue.put(("RECV", {"id": mid, "from": sender, "text": text}))
+            if self._safe_flag("crash_before_ack", False):
+                self._close(c)
+                return
 
-                if self._safe_flag("crash_before_ack", False):
-                    return
+            self._reply(c, {"type": "ACK", "id": mid})
 
-                try:
-                    send_json_line(conn, {"type": "ACK", "id": mid})
-                except Exception:
-                    return
+            if reply_to and not c.closed:
+                self.call_later(0.1, self._tx_pool.submit, self._send_delivered, reply_to, mid)
 
-                if reply_to:
-                    time.sleep(0.1)
-                    try:
-                        with socket.create_connection((HOST, reply_to), timeout=2.0) as c2:
-                            send_json_line(c2, {"type": "DELIVERED", "id": mid})
-                    except Exception:
-                        pass
-
-            elif mtype == "DELIVERED":
-                mid = msg.get("id")
-                self.inbox_queue.put(("ACK2", {"id": mid}))
-            else:
-                self.inbox_queue.put(("INFO", f"Recebido {mtype}: {msg}"))
+        elif mtype == "DELIVERED":
+            mid = msg.get("id")
+            self.inbox_queue.put(("ACK2", {"id": mid}))
+        else:
+            self.inbox_queue.put(("INFO", f"Recebido {mtype}: {msg}"))
+
+    def _send_delivered(self, reply_to, mid):
+        try:
+            with socket.create_connection((HOST, reply_to), timeout=2.0) as c2:
+                set_nodelay(c2)
+                send_framed(c2, {"type": "DELIVERED", "id": mid})
+        except Exception:
+            pass
 
     def stop(self):
         self.stop_event.set()
         try:
-            if self.socket:
-                self.socket.close()
-        except Exception:
+            self._wake_w.send(b"x")
+        except OSError:
+            pass
+
+class PeerLink:
+    """Conexão TCP persistente com o peer, reaberta sob demanda.
+
+    Uma thread leitora por socket entrega cada resposta (ACK/PONG) ao
+    Future registrado para o par (tipo, id).
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self._sock = None
+        self._lock = threading.Lock()
+        self._waiters = {}  # (tipo, id) -> (sock, Future)
+
+    def _get_sock(self, connect_timeout):
+        # Chamar com self._lock adquirido
+        if self._sock is None:
+            s = socket.create_connection((HOST, self.port), timeout=connect_timeout)
+            set_nodelay(s)
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)  # detecta peer morto
+            self._sock = s
+            threading.Thread(target=self._read_loop, args=(s,), daemon=True).start()
+        return self._sock
+
+    def _discard(self, s):
+        # Chamar com self._lock adquirido
+        if self._sock is s:
+            self._sock = None
+        try:
+            s.shutdown(socket.SHUT_RDWR)  # acorda a thread leitora
+        except OSError:
+            pass
+        s.close()
+        for key, (ws, fut) in list(self._waiters.items()):
+            if ws is s:
+                del self._waiters[key]
+                fut.set_exception(ConnectionError("conexão com o peer encerrada"))
+
+    def _read_loop(self, s):
+        try:
+            while True:
+                # Espera o próximo quadro sem prazo; o timeout do socket limita
+                # a escrita (e um quadro que pare no meio)
+                select.select([s], [], [])
+                msg = recv_framed(s)
+                if msg is None:
+                    break
+                with self._lock:
+                    entry = self._waiters.pop((msg.get("type"), msg.get("id")), None)
+                if entry:
+                    entry[1].set_result(msg)
+        except (OSError, ValueError, AttributeError):
             pass
+        finally:
+            with self._lock:
+                self._discard(s)
+
+    def send(self, frame, connect_timeout=2.5, expect=None):
+        """Envia um quadro já codificado (encode_frame); com expect=(tipo, id)
+        devolve o Future da resposta."""
+        with self._lock:
+            try:
+                s = self._get_sock(connect_timeout)
+                s.settimeout(connect_timeout)  # peer travado não pendura a UI
+                s.sendall(frame)
+            except OSError:
+                # O peer pode ter fechado a conexão ociosa: reabre uma vez
+                if self._sock is not None:
+                    self._discard(self._sock)
+                s = self._get_sock(connect_timeout)
+                s.sendall(frame)
+            if expect is None:
+                return None
+            fut = Future()
+            self._waiters[expect] = (s, fut)
+            return fut
+
+    def request(self, frame, expect, timeout, connect_timeout=2.5):
+        fut = self.send(frame, connect_timeout, expect)
+        try:
+            return fut.result(timeout)
+        finally:
+            with self._lock:
+                entry = self._waiters.get(expect)
+                if entry and entry[1] is fut:
+                    del self._waiters[expect]
+
+    def close(self):
+        with self._lock:
+            if self._sock is not None:
+                self._discard(self._sock)
 
 class NodeApp:
-    def __init__(self, name, port, peer_port, simple_mode=False):
+    # Cenário (nome exibido no Combobox) -> ajuste das flags; "Nenhum" só reseta
+    _SCENARIOS = {
+        "Queda aleatória (50%)": lambda self: self.out_drop_pct.set(50),
+        "Travar antes do ACK₁ (destino)": lambda self: self.crash_before_ack.set(True),
+        "Atraso no destino (1500ms)": lambda self: self.proc_delay_ms.set(1500),
+        "Partição (rejeitar conexões)": lambda self: self.reject_conn.set(True),
+        "Duplicar envio": lambda self: self.out_duplicate.set(True),
+    }
+
+    def __init__(self, name, port, peer_port, simple_mode=False, seed=None):
         self.name = name
         self.port = port
         self.peer_port = peer_port
         self.simple_mode = simple_mode
+        self.rng = random.Random(seed)  # semente fixa => quedas e retentativas reproduzíveis
 
         self.root = tk.Tk()
         title_suffix = "— Modo Apresentação" if self.simple_mode else ""
@@ -177,6 +486,7 @@ class NodeApp:
         self.reject_conn = tk.BooleanVar(value=False)
         self.ack_timeout_ms = tk.IntVar(value=1500 if self.simple_mode else 3000)
         self.max_retries = tk.IntVar(value=4 if self.simple_mode else 3)
+        self.retry_max_ms = tk.IntVar(value=30000)
 
         # Tratamento de falhas / Outbox / Dedup
         self.fail_treatment = tk.BooleanVar(value=False)
@@ -194,16 +504,39 @@ class NodeApp:
             "max_retries": self.max_retries,
         }
 
+        # Cópias em int das variáveis lidas a cada envio/retentativa, mantidas por trace
+        self._cache_int("_out_delay_ms", self.out_delay_ms)
+        self._cache_int("_out_drop_pct", self.out_drop_pct)
+        self._cache_int("_ack_timeout_ms", self.ack_timeout_ms)
+        self._cache_int("_max_retries", self.max_retries)
+        self._cache_int("_retry_max_ms", self.retry_max_ms)
+
         self.inbox_queue = queue.Queue()
-        self.server = ServerThread(self.name, self.port, self.inbox_queue, self.ui_flags)
+        self.server = ServerThread(self.name, self.port, self.inbox_queue, self._flag_values())
         self.server.start()
+        for var in self.ui_flags.values():
+            var.trace_add("write", self._publish_flags)
+        self.peer = PeerLink(self.peer_port)
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tx")
 
         self.pending: Dict[str, MessageStatus] = {}
+        self.pending_ttl_ms = 60_000  # após esgotar tentativas (a Outbox mantém a sua referência)
+        self._evict_armed: Set[str] = set()  # ids de pending com remoção já agendada
         self.outbox: Dict[str, MessageStatus] = {}
-        self.seen_ids = {}
-        self.seen_ids_max = 1000  # LRU simples
+        # Índice secundário da Outbox: ids que podem estar prontos para reenvio
+        # (o estado é reconferido no tick; entradas obsoletas são descartadas)
+        self._ready: Deque[str] = deque()
+        self._ready_set: Set[str] = set()
+        self.seen_ids = OrderedDict()  # id -> None, em ordem de uso (LRU)
+        self.seen_ids_max = 1000
 
         self._watcher_active = False
+        self._peer_ok_until = 0.0  # monotonic: peer respondeu há pouco, dispensa PING
+        self.peer_ok_ttl = 2.0
+        self._idle_ticks = 0
+        self._dirty_rows: Set[str] = set()  # linhas da Outbox a redesenhar
+        self._flush_scheduled = False
+        self.inbox_batch_max = 200  # eventos tratados por tick da UI
 
         self._build_ui()
         self.root.after(100, self._poll_inbox)
@@ -244,9 +577,7 @@ class NodeApp:
         ttk.Label(row, text="Cenário:").pack(side="left")
         self.scenario = tk.StringVar(value="Nenhum")
         combo = ttk.Combobox(row, textvariable=self.scenario, state="readonly",
-                             values=["Nenhum", "Queda aleatória (50%)", "Travar antes do ACK₁ (destino)",
-                                     "Atraso no destino (1500ms)", "Partição (rejeitar conexões)",
-                                     "Duplicar envio"])
+                             values=["Nenhum", *self._SCENARIOS])
         combo.pack(side="left", padx=8)
         combo.bind("<<ComboboxSelected>>", self.apply_scenario)
         ttk.Button(row, text="Reset", command=self.reset_scenario).pack(side="left", padx=(8,0))
@@ -277,29 +608,50 @@ class NodeApp:
     def _outbox_add(self, st: MessageStatus):
         st.state = "queued"
         self.outbox[st.id] = st
+        self._mark_ready(st.id)
         self._outbox_sync_row(st)
         self._update_outbox_counter()
         self.log(f"📦 Guardada na Outbox: {st.id[:8]}")
         self._ensure_watcher_running()
 
     def _outbox_sync_row(self, st: MessageStatus):
-        iid = st.id
-        values = (iid[:8], st.text[:64], st.state, st.attempts, (st.last_error or "")[:64])
-        if self.outbox_tv.exists(iid):
-            self.outbox_tv.item(iid, values=values)
-        else:
-            self.outbox_tv.insert("", "end", iid=iid, values=values)
+        # Apenas marca a linha; o Treeview é atualizado no máximo a cada 50ms
+        self._dirty_rows.add(st.id)
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.root.after(50, self._flush_outbox_rows)
+
+    def _flush_outbox_rows(self):
+        self._flush_scheduled = False
+        dirty, self._dirty_rows = self._dirty_rows, set()
+        for iid in dirty:
+            st = self.outbox.get(iid)
+            if not st:
+                continue
+            values = (iid[:8], st.text[:64], st.state, st.attempts, (st.last_error or "")[:64])
+            if self.outbox_tv.exists(iid):
+                self.outbox_tv.item(iid, values=values)
+            else:
+                self.outbox_tv.insert("", "end", iid=iid, values=values)
 
     def _outbox_update_state(self, mid: str, state: str):
         st = self.outbox.get(mid)
         if not st:
             return
         st.state = state
+        if state in ("queued", "failed"):
+            self._mark_ready(mid)
         self._outbox_sync_row(st)
 
+    def _mark_ready(self, mid: str):
+        if mid not in self._ready_set:
+            self._ready_set.add(mid)
+            self._ready.append(mid)
+
     def _outbox_remove(self, mid: str):
         if mid in self.outbox:
             del self.outbox[mid]
+        self._dirty_rows.discard(mid)
         if self.outbox_tv.exists(mid):
             self.outbox_tv.delete(mid)
         self._update_outbox_counter()
@@ -314,24 +666,28 @@ class NodeApp:
             self.root.after(500, self._connectivity_tick)
 
     def _peer_is_ready(self) -> bool:
-        """Conecta, envia PING e aguarda PONG para considerar o peer pronto."""
+        """Envia PING pela conexão persistente (reaberta se preciso) e aguarda PONG."""
+        pid = uuid.uuid4().hex
         try:
-            with socket.create_connection((HOST, self.peer_port), timeout=0.8) as s:
-                s.settimeout(0.6)
-                send_json_line(s, {"type": "PING"})
-                resp = json_line(s)
-                return bool(resp and resp.get("type") == "PONG")
+            self.peer.request(encode_frame({"type": "PING", "id": pid}), ("PONG", pid),
+                              timeout=0.6, connect_timeout=0.8)
         except Exception:
             return False
+        self._peer_ok_until = time.monotonic() + self.peer_ok_ttl
+        return True
 
     def _connectivity_tick(self):
         if not self.outbox:
             self._watcher_active = False
             return
 
-        if self._peer_is_ready():
-            for mid, st in list(self.outbox.items()):
-                if st.state in ("queued", "failed") and not st.ack1:
+        if self._ready and (time.monotonic() < self._peer_ok_until or self._peer_is_ready()):
+            # Só os ids já presentes: falhas neste tick voltam para o próximo
+            for _ in range(len(self._ready)):
+                mid = self._ready.popleft()
+                self._ready_set.discard(mid)
+                st = self.outbox.get(mid)
+                if st and st.state in ("queued", "failed") and not st.ack1:
                     self.log(f"🚚 Outbox: reenviando {mid[:8]}")
                     self._outbox_update_state(mid, "sending")
                     self._attempt_send(mid, st, attempt=st.attempts + 1)
@@ -343,19 +699,34 @@ class NodeApp:
         self.txt.insert("end", line + "\n")
         self.txt.see("end")
 
+    def _cache_int(self, attr, var):
+        def update(*_):
+            try:
+                setattr(self, attr, int(var.get()))
+            except (tk.TclError, ValueError):
+                pass
+        update()
+        var.trace_add("write", update)
+
+    def _flag_values(self):
+        values = {}
+        for key, var in self.ui_flags.items():
+            try:
+                values[key] = var.get()
+            except tk.TclError:
+                pass
+        return values
+
+    def _publish_flags(self, *_):
+        # Chamado pelo trace das variáveis; troca o dicionário inteiro
+        # (a leitura no reator é uma única referência)
+        self.server.flag_snapshot = self._flag_values()
+
     def apply_scenario(self, *_):
         self.reset_scenario()
-        sc = self.scenario.get()
-        if sc == "Queda aleatória (50%)":
-            self.out_drop_pct.set(50)
-        elif sc == "Travar antes do ACK₁ (destino)":
-            self.crash_before_ack.set(True)
-        elif sc == "Atraso no destino (1500ms)":
-            self.proc_delay_ms.set(1500)
-        elif sc == "Partição (rejeitar conexões)":
-            self.reject_conn.set(True)
-        elif sc == "Duplicar envio":
-            self.out_duplicate.set(True)
+        fn = self._SCENARIOS.get(self.scenario.get())
+        if fn:
+            fn(self)
 
     def reset_scenario(self):
         self.out_delay_ms.set(0)
@@ -397,15 +768,15 @@ class NodeApp:
             self._schedule_retry(mid, st)
             return
 
-        drop_pct = max(0, min(100, int(self.out_drop_pct.get())))
-        if drop_pct > 0 and random.randint(1, 100) <= drop_pct:
+        drop_pct = max(0, min(100, self._out_drop_pct))
+        if drop_pct and self.rng.random() * 100 < drop_pct:
             self.log(f"⚠️  (Simulado) Queda aleatória {drop_pct}%: {mid[:8]}")
             if mid not in self.outbox:
                 self._outbox_add(st)
             self._schedule_retry(mid, st)
             return
 
-        out_delay = max(0, int(self.out_delay_ms.get()))
+        out_delay = max(0, self._out_delay_ms)
         if out_delay > 0:
             self.log(f"⏳ Atraso de envio {out_delay}ms para {mid[:8]}")
             self.root.after(out_delay, lambda: self._do_send(mid, st))
@@ -421,26 +792,29 @@ class NodeApp:
             "reply_to_port": self.port,
             "ts": time.time(),
         }
+        # Serializado uma única vez: reaproveitado pelo envio duplicado
+        frame = encode_frame(payload)
 
         def one_send():
             try:
-                with socket.create_connection((HOST, self.peer_port), timeout=2.5) as s:
-                    s.settimeout(max(0.2, int(self.ack_timeout_ms.get()) / 1000.0 + 0.3))
-                    send_json_line(s, payload)
-                    resp = json_line(s)
-                    if not resp or resp.get("type") != "ACK" or resp.get("id") != mid:
-                        raise TimeoutError("ACK₁ não recebido")
-                    st.ack1 = True
-                    self.log(f"✅ ACK₁ recebido para {mid[:8]}")
+                timeout = max(0.2, self._ack_timeout_ms / 1000.0 + 0.3)
+                try:
+                    self.peer.request(frame, ("ACK", mid), timeout=timeout)
+                except FutureTimeout:
+                    raise TimeoutError("ACK₁ não recebido") from None
+                st.ack1 = True
+                self._peer_ok_until = time.monotonic() + self.peer_ok_ttl
+                self.log(f"✅ ACK₁ recebido para {mid[:8]}")
                 return True
             except Exception as e:
                 st.last_error = str(e)
+                self._peer_ok_until = 0.0  # falha confirmada: volta a sondar com PING
                 return False
 
         ok = one_send()
 
         if self.out_duplicate.get():
-            threading.Thread(target=lambda: self._duplicate_fire_and_forget(payload), daemon=True).start()
+            self._io_pool.submit(self._duplicate_fire_and_forget, frame)
 
         if ok:
             if mid in self.outbox:
@@ -455,35 +829,55 @@ class NodeApp:
                 self._outbox_sync_row(st)
             self._schedule_retry(mid, st)
 
-    def _duplicate_fire_and_forget(self, payload):
+    def _duplicate_fire_and_forget(self, frame):
         time.sleep(0.05)
         try:
-            with socket.create_connection((HOST, self.peer_port), timeout=1.5) as s:
-                s.settimeout(1.0)
-                send_json_line(s, payload)
+            self.peer.send(frame, connect_timeout=1.5)
         except Exception:
             pass
 
     def _schedule_retry(self, mid, st: MessageStatus):
         attempts = st.attempts
-        maxr = max(0, int(self.max_retries.get()))
+        maxr = max(0, self._max_retries)
         if attempts >= maxr:
             self.log(f"🛑 Sem mais tentativas para {mid[:8]} (tentativas={attempts})")
             # mantém/insere na Outbox como 'failed' para auto-flush posterior
             if mid not in self.outbox:
                 self._outbox_add(st)
             self._outbox_update_state(mid, "failed")
+            self._arm_pending_eviction(mid)
             return
-        delay_ms = 1000 * (2 ** (attempts - 1))
+        # Backoff exponencial com "full jitter" (AWS, "Exponential Backoff And Jitter"):
+        # delay = random(0, min(teto, base * 2^(tentativas-1))), evitando que vários
+        # nós retentem em sincronia quando a partição se desfaz.
+        cap = min(max(0, self._retry_max_ms), 1000 * (1 << (attempts - 1)))
+        delay_ms = self.rng.randint(0, cap)
         st.next_retry_ms = delay_ms
         self.log(f"🔁 Retentativa #{attempts+1} para {mid[:8]} em {delay_ms}ms")
         self.root.after(delay_ms, lambda: self._attempt_send(mid, st, attempt=attempts+1))
 
+    def _arm_pending_eviction(self, mid):
+        # Um único timer por mensagem, mesmo que o auto-flush esgote as tentativas de novo
+        if mid in self.pending and mid not in self._evict_armed:
+            self._evict_armed.add(mid)
+            self.root.after(self.pending_ttl_ms, lambda: self._evict_pending(mid))
+
+    def _evict_pending(self, mid):
+        st = self.outbox.get(mid)
+        if st and st.state != "failed":
+            # Reenvio em curso pela Outbox: adia a remoção
+            self.root.after(self.pending_ttl_ms, lambda: self._evict_pending(mid))
+            return
+        self._evict_armed.discard(mid)
+        self.pending.pop(mid, None)
+
     # ---------------- Inbox / events ----------------
     def _poll_inbox(self):
+        drained = 0
         try:
-            while True:
+            for _ in range(self.inbox_batch_max):
                 ev, data = self.inbox_queue.get_nowait()
+                drained += 1
                 if ev == "RECV":
                     mid = data["id"]
                     sender = data["from"]
@@ -491,14 +885,11 @@ class NodeApp:
                     if self.dedup_by_id.get():
                         if mid in self.seen_ids:
                             self.log(f"🧹 Duplicata descartada (id={mid[:8]})")
-                            self.seen_ids[mid] = time.time()
-                            if len(self.seen_ids) > self.seen_ids_max:
-                                self._prune_seen()
+                            self.seen_ids.move_to_end(mid)
                             continue
-                        else:
-                            self.seen_ids[mid] = time.time()
-                            if len(self.seen_ids) > self.seen_ids_max:
-                                self._prune_seen()
+                        self.seen_ids[mid] = None
+                        if len(self.seen_ids) > self.seen_ids_max:
+                            self.seen_ids.popitem(last=False)
 
                     self.log(f"📥 [{sender}] → [{self.name}] recebeu {mid[:8]}: {text}")
 
@@ -507,7 +898,7 @@ class NodeApp:
 
                 elif ev == "ACK2":
                     mid = data["id"]
-                    st = self.pending.get(mid)
+                    st = self.pending.pop(mid, None)
                     if st:
                         st.ack2 = True
                     self.log(f"📬 ACK₂ (Entregue) para {mid[:8]}")
@@ -517,18 +908,22 @@ class NodeApp:
         except queue.Empty:
             pass
 
-        self.root.after(100, self._poll_inbox)
-
-    def _prune_seen(self):
-        oldest_key = min(self.seen_ids, key=self.seen_ids.get)
-        if oldest_key:
-            del self.seen_ids[oldest_key]
+        # Intervalo adaptativo: 10ms sob tráfego, recuando até 250ms quando ocioso
+        if drained:
+            self._idle_ticks = 0
+            next_ms = 10
+        else:
+            self._idle_ticks += 1
+            next_ms = min(250, 50 + 20 * self._idle_ticks)
+        self.root.after(next_ms, self._poll_inbox)
 
     def on_close(self):
         try:
             self.server.stop()
         except Exception:
             pass
+        self._io_pool.shutdown(wait=False, cancel_futures=True)
+        self.peer.close()
         self.root.destroy()
 
 def main():
@@ -544,8 +939,9 @@ def main():
     port = get_arg("--port", int, 5000)
     peer = get_arg("--peer", int, 5001)
     simple = ("--simple" in sys.argv) or True
+    seed = get_arg("--seed", int, None)
 
-    app = NodeApp(name, port, peer, simple_mode=simple)
+    app = NodeApp(name, port, peer, simple_mode=simple, seed=seed)
     app.root.mainloop()
 
 if __name__ == "__main__":